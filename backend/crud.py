@@ -0,0 +1,80 @@
+from typing import Iterable, List, Optional
+from sqlalchemy import select, bindparam
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session, make_transient_to_detached
+from models import User
+from user_cache import user_cache
+
+# Собирается один раз, при вызове передаётся только параметр uid
+USER_BY_ID = select(User).where(User.id == bindparam("uid"))
+
+
+# Привязка закэшированного пользователя к сессии без SELECT
+def _attach_cached_user(db: Session, user_id: int, name: str) -> User:
+    user = User(id=user_id, name=name)
+    make_transient_to_detached(user)
+    return db.merge(user, load=False)
+
+
+# Получение пользователя по id: сначала кэш, затем база
+def get_user(db: Session, user_id: int) -> Optional[User]:
+    user_id = int(user_id)
+    cached = user_cache.get_by_id(user_id)
+    if cached:
+        return _attach_cached_user(db, *cached)
+
+    user = db.execute(USER_BY_ID, {"uid": user_id}).scalar_one_or_none()
+    if user:
+        user_cache.put(user.id, user.name)
+    return user
+
+
+# Получение пользователей по именам одним запросом, недостающие создаются без коммита
+def get_or_create_users_by_name(db: Session, names: Iterable[str]) -> List[User]:
+    names = list(dict.fromkeys(names))
+    if not names:
+        return []
+
+    existing = {}
+    for name in names:
+        cached = user_cache.get_by_name(name)
+        if cached:
+            existing[name] = _attach_cached_user(db, *cached)
+
+    uncached = [name for name in names if name not in existing]
+    if uncached:
+        found = db.query(User).filter(User.name.in_(uncached)).all()
+        user_cache.put_many(found)
+        existing.update({user.name: user for user in found})
+
+    missing = [name for name in names if name not in existing]
+    if missing:
+        # Один INSERT OR IGNORE на всех недостающих, коммит остаётся за вызывающим
+        db.execute(insert(User).values([{"name": name} for name in missing]).on_conflict_do_nothing(index_elements=["name"]))
+        existing.update({user.name: user for user in db.query(User).filter(User.name.in_(missing)).all()})
+    return [existing[name] for name in names]
+
+
+# Получение пользователей по id одним запросом, недостающие создаются как "User {id}"
+def get_or_create_users_by_id(db: Session, user_ids: Iterable[int]) -> List[User]:
+    user_ids = list(dict.fromkeys(int(user_id) for user_id in user_ids))
+    if not user_ids:
+        return []
+
+    existing = {}
+    for user_id in user_ids:
+        cached = user_cache.get_by_id(user_id)
+        if cached:
+            existing[user_id] = _attach_cached_user(db, *cached)
+
+    uncached = [user_id for user_id in user_ids if user_id not in existing]
+    if uncached:
+        found = db.query(User).filter(User.id.in_(uncached)).all()
+        user_cache.put_many(found)
+        existing.update({user.id: user for user in found})
+
+    missing = [user_id for user_id in user_ids if user_id not in existing]
+    if missing:
+        db.execute(insert(User).values([{"id": user_id, "name": f"User {user_id}"} for user_id in missing]).on_conflict_do_nothing(index_elements=["id"]))
+        existing.update({user.id: user for user in db.query(User).filter(User.id.in_(missing)).all()})
+    return [existing[user_id] for user_id in user_ids]
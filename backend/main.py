@@ -1,42 +1,116 @@
 import logging
+import os
+from collections import defaultdict
 from fastapi import FastAPI, HTTPException, Depends, Request, Form
-from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String, inspect
-from sqlalchemy.orm import Session
+from sqlalchemy import MetaData, Table, Column, Integer, String, inspect, func, text, select, bindparam
+from sqlalchemy.orm import Session, selectinload, raiseload, load_only
 from database import SessionLocal, engine, Base
-from models import Room, ExpenseType, Data, User
+from models import Room, ExpenseType, Data, User, InvoiceShare
 from pydantic import BaseModel
 from fastapi.responses import JSONResponse
 from typing import List, Optional, Dict
 from urllib.parse import quote
-import models, schemas
+import models, schemas, crud
 from schemas import UserBase, RoomCreate, RoomUpdate
+from response_cache import cached_response, invalidate_rooms
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# одключение к SQLite (файл базы данных)
-DATABASE_URL = "sqlite:///./rooms.db"  # Файл базы данных будет создан в текущей директории
 BASE_URL = "http://127.0.0.1:8000"  
+# Вне production любая неявная ленивая загрузка связей в GET-эндпоинтах падает с ошибкой
+APP_ENV = os.getenv("APP_ENV", "development")
+STRICT_LOADING = APP_ENV != "production"
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# Подключение к SQLite берётся из database.py, чтобы PRAGMA применялись к единственному engine
 metadata = MetaData()
-# Создание базы данных
-Base.metadata.create_all(bind=engine)
 
 app = FastAPI()
 
 # Function to drop and recreate the table
 def reset_database():
     inspector = inspect(engine)
+    if 'invoice_shares' in inspector.get_table_names():
+        models.InvoiceShare.__table__.drop(engine)
     if 'data' in inspector.get_table_names():
         models.Data.__table__.drop(engine)
+    # Связи участников удаляются вместе с комнатами, иначе старые строки конфликтуют с ix_rp_room_user
+    if 'room_participants' in inspector.get_table_names():
+        models.room_participants.drop(engine)
     if 'rooms' in inspector.get_table_names():
         models.Room.__table__.drop(engine)
     models.Base.metadata.create_all(bind=engine)
 
-# Reset the database schema
-reset_database()
+# Перенос старой схемы: список id счетов в rooms.invoices (JSON) -> внешний ключ data.room_id
+def migrate_invoices_to_room_fk():
+    inspector = inspect(engine)
+    if 'data' not in inspector.get_table_names():
+        return
+    if 'room_id' in {column['name'] for column in inspector.get_columns('data')}:
+        return
+
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE data ADD COLUMN room_id INTEGER REFERENCES rooms(id)"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_data_room_id ON data (room_id)"))
+        if 'rooms' in inspector.get_table_names() and 'invoices' in {column['name'] for column in inspector.get_columns('rooms')}:
+            conn.execute(text(
+                "UPDATE data SET room_id = ("
+                "SELECT rooms.id FROM rooms, json_each(rooms.invoices) "
+                "WHERE json_each.value = data.id LIMIT 1)"
+            ))
+
+# create_all не добавляет индексы в уже существующие таблицы, поэтому создаём недостающие отдельно
+def create_missing_indexes():
+    inspector = inspect(engine)
+    if 'room_participants' in inspector.get_table_names() and 'ix_rp_room_user' not in {
+        index['name'] for index in inspector.get_indexes('room_participants')
+    }:
+        # Дубликаты связей мешают построить уникальный индекс ix_rp_room_user; после его создания их быть не может
+        with engine.begin() as conn:
+            conn.execute(text(
+                "DELETE FROM room_participants WHERE rowid NOT IN ("
+                "SELECT MIN(rowid) FROM room_participants GROUP BY room_id, user_id)"
+            ))
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+# Заполнение новой таблицы invoice_shares из JSON-колонки data.user_sums существующих счетов
+def backfill_invoice_shares():
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT OR IGNORE INTO invoice_shares (invoice_id, user_id, amount) "
+            "SELECT data.id, CAST(json_each.key AS INTEGER), json_each.value "
+            "FROM data, json_each(data.user_sums) WHERE json_each.value IS NOT NULL"
+        ))
+
+# Создание базы данных; схема сбрасывается только при явном RESET_DB=1
+def init_db():
+    if os.getenv("RESET_DB") == "1":
+        reset_database()
+        create_missing_indexes()
+    else:
+        migrate_invoices_to_room_fk()
+        tables = inspect(engine).get_table_names()
+        Base.metadata.create_all(bind=engine)
+        create_missing_indexes()
+        if 'data' in tables and 'invoice_shares' not in tables:
+            backfill_invoice_shares()
+
+@app.on_event("startup")
+def on_startup():
+    init_db()
+
+# Опции загрузки для GET-эндпоинтов: явные selectinload + raiseload("*") на всё остальное
+def strict_loading(*options):
+    if STRICT_LOADING:
+        return (*options, raiseload("*"))
+    return options
+
+# Запросы счёта по id собираются один раз на уровне модуля, SQLAlchemy переиспользует их скомпилированный SQL
+DATA_BY_ID = select(Data).where(Data.id == bindparam("did"))
+INVOICE_WITH_CREATOR_BY_ID = DATA_BY_ID.options(*strict_loading(selectinload(Data.creator)))
 
 # Зависимость для подключения к базе данных
 def get_db():
@@ -59,12 +133,14 @@ class RoomUpdate(BaseModel):
     invoices: Optional[List[int]] = None
 
 #Логика для кнопки, выступает в роли POST
+# Обработчики с синхронной сессией объявлены через def: FastAPI выполняет их в пуле потоков, не блокируя event loop
 @app.post("/api/submit_form/")
-async def submit_form_create_room( 
+def submit_form_create_room( 
     name: str = Form(...),
     expense_type: str = Form(...),
     participants: str = Form(...),
-    total_amount: Optional[float] = Form(None)  # Опциональное поле для суммы
+    total_amount: Optional[float] = Form(None),  # Опциональное поле для суммы
+    db: Session = Depends(get_db)
 ):
     # Проверка входных данных
     if not name or not expense_type or not participants:
@@ -81,20 +157,12 @@ async def submit_form_create_room(
         raise HTTPException(status_code=400, detail="Invalid expense type")
 
     # Split participants into a list
-    participants_list = participants.split(",")
+    participants_list = [participant.strip() for participant in participants.split(",") if participant.strip()]
 
     # Create the room
-    db = SessionLocal()
     try:
-        db_participants = []
-        for participant in participants_list:
-            user = db.query(User).filter(User.name == participant).first()
-            if not user:
-                user = User(name=participant)
-                db.add(user)
-                db.commit()
-                db.refresh(user)
-            db_participants.append(user)
+        # Existing users are fetched with one IN query, missing ones are inserted in one statement and committed with the room
+        db_participants = crud.get_or_create_users_by_name(db, participants_list)
 
         db_room = Room(
             name=name,
@@ -104,12 +172,9 @@ async def submit_form_create_room(
         )
         db.add(db_room)
         db.commit()
-        db.refresh(db_room)
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail="Internal Server Error")
-    finally:
-        db.close()
 
     # Генерация уникальной ссылки на комнату
     room_id = name.replace(" ", "_").lower()  # Генерация ID на основе имени
@@ -125,15 +190,7 @@ async def submit_form_create_room(
 @app.post("/api/rooms/", response_model=schemas.RoomResponse)
 def create_room(room: RoomCreate, db: Session = Depends(get_db)):
     # Create users if they do not exist
-    db_participants = []
-    for participant_id in room.participants:
-        user = db.query(User).filter(User.id == participant_id).first()
-        if not user:
-            user = User(id=participant_id, name=f"User {participant_id}")
-            db.add(user)
-            db.commit()
-            db.refresh(user)
-        db_participants.append(user)
+    db_participants = crud.get_or_create_users_by_id(db, room.participants)
 
     db_room = Room(
         name=room.name,
@@ -146,21 +203,32 @@ def create_room(room: RoomCreate, db: Session = Depends(get_db)):
     db.refresh(db_room)
     return db_room
 
+# Список комнат: выбираются только нужные колонки, без загрузки участников и счетов
+@app.get("/api/rooms/", response_model=List[schemas.RoomSummary])
+def list_rooms(db: Session = Depends(get_db)):
+    return db.execute(select(Room.id, Room.name, Room.expense_type).order_by(Room.id)).all()
+
 @app.get("/api/room/{room_id}")
-async def get_room(room_id: int, db: Session = Depends(get_db)):
-    room = db.query(Room).filter(Room.id == room_id).first()
+def get_room(room_id: int, db: Session = Depends(get_db)):
+    room = db.query(Room).options(
+        *strict_loading(selectinload(Room.participants), selectinload(Room.invoices).load_only(Data.id))
+    ).filter(Room.id == room_id).first()
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
     return {
         "name": room.name,
         "expense_type": room.expense_type.value,
         "participants": room.participants,
-        "invoices": room.invoices
+        "invoices": [invoice.id for invoice in room.invoices]
     }
 
-@app.put("/api/room/{room_id}", response_model=dict)
+@app.put("/api/room/{room_id}", response_model=schemas.RoomResponse)
 def update_room(room_id: int, room: schemas.RoomUpdate, db: Session = Depends(get_db)):
-    db_room = db.query(Room).filter(Room.id == room_id).first()
+    # Счета комнаты нужны только как id: для пересборки коллекции и для ответа
+    room_query = select(Room).options(
+        selectinload(Room.participants), selectinload(Room.invoices).load_only(Data.id)
+    ).where(Room.id == room_id)
+    db_room = db.execute(room_query).scalar_one_or_none()
     if not db_room:
         raise HTTPException(status_code=404, detail="Room not found")
 
@@ -169,75 +237,68 @@ def update_room(room_id: int, room: schemas.RoomUpdate, db: Session = Depends(ge
     if room.expense_type is not None:
         db_room.expense_type = room.expense_type
     if room.participant_ids is not None:
-        db_participants = db.query(User).filter(User.id.in_(room.participant_ids)).all()
+        db_participants = db.scalars(select(User).where(User.id.in_(room.participant_ids))).all()
         if not db_participants:
             raise HTTPException(status_code=400, detail="Participants not found")
         db_room.participants = db_participants
+
+    # Users who must end up in the room: everyone with a share in its invoices plus additional_props
+    needed_user_ids = set()
+    # Rooms whose cached aggregates change with this update (invoices may move from other rooms)
+    touched_room_ids = {room_id}
     if room.invoices is not None:
-        db_room.invoices = room.invoices
+        db_invoices = db.scalars(
+            select(Data).options(load_only(Data.id, Data.room_id)).where(Data.id.in_(room.invoices))
+        ).all()
+        touched_room_ids.update(invoice.room_id for invoice in db_invoices)
+        db_room.invoices = db_invoices
 
         # Sync users from invoices
-        for invoice_id in room.invoices:
-            invoice = db.query(Data).filter(Data.id == invoice_id).first()
-            if invoice:
-                for user_id in invoice.user_sums.keys():
-                    user = db.query(User).filter(User.id == user_id).first()
-                    if not user:
-                        user = User(id=user_id, name=f"User {user_id}")
-                        db.add(user)
-                        db.commit()
-                        db.refresh(user)
-                    if user not in db_room.participants:
-                        db_room.participants.append(user)
+        needed_user_ids.update(db.scalars(
+            select(InvoiceShare.user_id).where(InvoiceShare.invoice_id.in_(room.invoices)).distinct()
+        ).all())
 
     # Sync additional_props as users in the room
     if hasattr(room, 'additional_props'):
-        for user_id in room.additional_props:
-            user = db.query(User).filter(User.id == user_id).first()
-            if not user:
-                user = User(id=user_id, name=f"User {user_id}")
-                db.add(user)
-                db.commit()
-                db.refresh(user)
-            if user not in db_room.participants:
-                db_room.participants.append(user)
+        needed_user_ids.update(int(user_id) for user_id in room.additional_props)
+
+    # Only users missing from the room are fetched, new ones are inserted with one ON CONFLICT DO NOTHING
+    missing_in_room = needed_user_ids - {user.id for user in db_room.participants}
+    if missing_in_room:
+        db_room.participants.extend(crud.get_or_create_users_by_id(db, sorted(missing_in_room)))
 
     db.commit()
-    db.refresh(db_room)
-    return db_room
+    invalidate_rooms(*touched_room_ids)
+    # Повторный запрос вместо refresh, чтобы в ответ снова попали только id счетов
+    return db.execute(room_query).scalar_one()
 
 @app.delete("/api/room/{room_id}", response_model=dict)
 def delete_room(room_id: int, db: Session = Depends(get_db)):
-    room = db.query(Room).filter(Room.id == room_id).first()
+    # Для отвязки счетов от комнаты достаточно их id
+    room = db.query(Room).options(
+        selectinload(Room.participants), selectinload(Room.invoices).load_only(Data.id)
+    ).filter(Room.id == room_id).first()
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
     
     db.delete(room)
     db.commit()
+    invalidate_rooms(room_id)
     return {"message": "Room deleted successfully"}
 
 @app.post("/api/invoice/", response_model=schemas.DataResponse)
 def create_invoice(invoice: schemas.DataCreate, db: Session = Depends(get_db)):
-    creator = db.query(User).filter(User.id == invoice.creator_id).first()
+    creator = crud.get_user(db, invoice.creator_id)
     if not creator:
         raise HTTPException(status_code=404, detail="Creator not found")
 
-    user_ids = invoice.user_sums.keys()
-    users = []
-    for user_id in user_ids:
-        user = db.query(User).filter(User.id == user_id).first()
-        if not user:
-            user = User(id=user_id, name=f"User {user_id}")
-            db.add(user)
-            db.commit()
-            db.refresh(user)
-        users.append(user)
-
-    # Ensure all users in the invoice are participants in the room
-    room = db.query(Room).filter(Room.id == invoice.room_id).first()
+    room = db.query(Room).options(selectinload(Room.participants)).filter(Room.id == invoice.room_id).first()
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
-    
+
+    users = crud.get_or_create_users_by_id(db, invoice.user_sums.keys())
+
+    # Ensure all users in the invoice are participants in the room
     for user in users:
         if user not in room.participants:
             room.participants.append(user)
@@ -249,17 +310,21 @@ def create_invoice(invoice: schemas.DataCreate, db: Session = Depends(get_db)):
         total=invoice.total,
         user_sums=invoice.user_sums,
         creator=creator,
+        # Через room_id, а не room=room: иначе back_populates подгрузит все счета комнаты
+        room_id=room.id,
+        shares=[InvoiceShare(user_id=user_id, amount=amount) for user_id, amount in invoice.user_sums.items()],
         status=False
     )
     db.add(new_invoice)
     db.commit()
+    invalidate_rooms(invoice.room_id)
     db.refresh(new_invoice)
     return new_invoice
 
 @app.get("/api/invoice/{invoice_id}", response_model=schemas.DataResponse)
 def get_invoice(invoice_id: int, db: Session = Depends(get_db)):
     try:
-        invoice = db.query(models.Data).filter(models.Data.id == invoice_id).first()
+        invoice = db.execute(INVOICE_WITH_CREATOR_BY_ID, {"did": invoice_id}).scalar_one_or_none()
         if not invoice:
             raise HTTPException(status_code=404, detail="Invoice not found")
         return invoice
@@ -269,7 +334,7 @@ def get_invoice(invoice_id: int, db: Session = Depends(get_db)):
 @app.put("/api/invoice/{invoice_id}", response_model=schemas.DataResponse)
 def update_invoice(invoice_id: int, invoice: schemas.DataCreate, db: Session = Depends(get_db)):
     try:
-        db_invoice = db.query(models.Data).filter(models.Data.id == invoice_id).first()
+        db_invoice = db.execute(DATA_BY_ID, {"did": invoice_id}).scalar_one_or_none()
         if not db_invoice:
             raise HTTPException(status_code=404, detail="Invoice not found")
 
@@ -278,10 +343,11 @@ def update_invoice(invoice_id: int, invoice: schemas.DataCreate, db: Session = D
         db_invoice.date = invoice.date
         db_invoice.total = invoice.total
         db_invoice.user_sums = invoice.user_sums
-        db_invoice.creator_name = invoice.creator_name
+        db_invoice.shares = [InvoiceShare(user_id=user_id, amount=amount) for user_id, amount in invoice.user_sums.items()]
 
         db.commit()
         db.refresh(db_invoice)
+        invalidate_rooms(db_invoice.room_id)
         return db_invoice
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -289,12 +355,14 @@ def update_invoice(invoice_id: int, invoice: schemas.DataCreate, db: Session = D
 @app.delete("/api/invoice/{invoice_id}", response_model=schemas.DataResponse)
 def delete_invoice(invoice_id: int, db: Session = Depends(get_db)):
     try:
-        invoice = db.query(models.Data).filter(models.Data.id == invoice_id).first()
+        invoice = db.execute(DATA_BY_ID, {"did": invoice_id}).scalar_one_or_none()
         if not invoice:
             raise HTTPException(status_code=404, detail="Invoice not found")
 
+        room_id = invoice.room_id
         db.delete(invoice)
         db.commit()
+        invalidate_rooms(room_id)
         return invoice
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -302,7 +370,7 @@ def delete_invoice(invoice_id: int, db: Session = Depends(get_db)):
 @app.put("/api/invoice/{invoice_id}/request-close", response_model=schemas.DataResponse)
 def request_close_invoice(invoice_id: int, db: Session = Depends(get_db)):
     try:
-        invoice = db.query(models.Data).filter(models.Data.id == invoice_id).first()
+        invoice = db.execute(DATA_BY_ID, {"did": invoice_id}).scalar_one_or_none()
         if not invoice:
             raise HTTPException(status_code=404, detail="Invoice not found")
 
@@ -318,7 +386,7 @@ def request_close_invoice(invoice_id: int, db: Session = Depends(get_db)):
 @app.put("/api/invoice/{invoice_id}/confirm-close", response_model=schemas.DataResponse)
 def confirm_close_invoice(invoice_id: int, db: Session = Depends(get_db)):
     try:
-        invoice = db.query(models.Data).filter(models.Data.id == invoice_id).first()
+        invoice = db.execute(DATA_BY_ID, {"did": invoice_id}).scalar_one_or_none()
         if not invoice:
             raise HTTPException(status_code=404, detail="Invoice not found")
 
@@ -333,102 +401,96 @@ def confirm_close_invoice(invoice_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/api/room/{room_id}/total_invoices", response_model=float)
+@cached_response
 def get_total_invoices(room_id: int, db: Session = Depends(get_db)):
-    room = db.query(Room).filter(Room.id == room_id).first()
+    room = db.query(Room.id).filter(Room.id == room_id).first()
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
     
-    total_sum = 0.0
-    for invoice_id in room.invoices:
-        invoice = db.query(Data).filter(Data.id == invoice_id).first()
-        if invoice:
-            total_sum += invoice.total
+    total_sum = db.query(func.coalesce(func.sum(Data.total), 0.0)).filter(Data.room_id == room_id).scalar()
     
     return total_sum
 
 @app.get("/api/user/{user_id}/total_invoices", response_model=float)
+@cached_response
 def get_total_invoices_by_user(user_id: int, db: Session = Depends(get_db)):
-    invoices = db.query(Data).filter(Data.creator_id == user_id).all()
-    
-    total_sum = sum(invoice.total for invoice in invoices)
+    total_sum = db.query(func.coalesce(func.sum(Data.total), 0.0)).filter(Data.creator_id == user_id).scalar()
     
     return total_sum
 
 @app.get("/api/room/{room_id}/user/{user_id}/total_invoices", response_model=float)
+@cached_response
 def get_total_invoices_by_user_in_room(room_id: int, user_id: int, db: Session = Depends(get_db)):
-    room = db.query(Room).filter(Room.id == room_id).first()
+    room = db.query(Room.id).filter(Room.id == room_id).first()
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
     
-    total_sum = 0.0
-    for invoice_id in room.invoices:
-        invoice = db.query(Data).filter(Data.id == invoice_id, Data.creator_id == user_id).first()
-        if invoice:
-            total_sum += invoice.total
+    total_sum = db.query(func.coalesce(func.sum(Data.total), 0.0)).filter(
+        Data.room_id == room_id, Data.creator_id == user_id
+    ).scalar()
     
     return total_sum
 
 @app.get("/api/room/{room_id}/balance/{user1_id}/{user2_id}", response_model=float)
+@cached_response
 def get_balance_between_users_in_room(room_id: int, user1_id: int, user2_id: int, db: Session = Depends(get_db)):
-    room = db.query(Room).filter(Room.id == room_id).first()
+    room = db.query(Room.id).filter(Room.id == room_id).first()
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
     
-    user1_balance = 0.0
-    user2_balance = 0.0
-
-    for invoice_id in room.invoices:
-        invoice = db.query(Data).filter(Data.id == invoice_id).first()
-        if invoice:
-            user_sums = invoice.user_sums
-            if user1_id in user_sums:
-                user1_balance += user_sums[user1_id]
-            if user2_id in user_sums:
-                user2_balance += user_sums[user2_id]
-
-    total_balance = user1_balance - user2_balance
-    return total_balance
+    # Суммы долей обоих пользователей одним GROUP BY по invoice_shares
+    sums = dict(
+        db.query(InvoiceShare.user_id, func.sum(InvoiceShare.amount))
+        .join(Data, Data.id == InvoiceShare.invoice_id)
+        .filter(Data.room_id == room_id, InvoiceShare.user_id.in_([user1_id, user2_id]))
+        .group_by(InvoiceShare.user_id)
+        .all()
+    )
 
-from collections import defaultdict
+    total_balance = sums.get(user1_id, 0.0) - sums.get(user2_id, 0.0)
+    return total_balance
 
 @app.get("/api/room/{room_id}/balances", response_model=Dict[int, Dict[int, float]])
+@cached_response
 def get_balances_in_room(room_id: int, db: Session = Depends(get_db)):
-    room = db.query(Room).filter(Room.id == room_id).first()
+    room = db.query(Room.id).filter(Room.id == room_id).first()
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
     
     debts = defaultdict(lambda: defaultdict(float))
-    participants = {user.id: user for user in room.participants}
+    # Only participant ids are needed, read them from the association table (ix_rp_room_user)
+    participants = {
+        user_id for (user_id,) in db.query(models.room_participants.c.user_id).filter(models.room_participants.c.room_id == room_id)
+    }
     
-    # Collect all invoices in the room
-    for invoice_id in room.invoices:
-        invoice = db.query(Data).filter(Data.id == invoice_id).first()
-        if not invoice or not invoice.user_sums:
-            continue
-        
-        creator_id = invoice.creator_id
-        user_sums = invoice.user_sums
-        
-        # Each user owes the creator their amount in user_sums
-        for user_id, amount in user_sums.items():
-            if user_id != creator_id:
-                debts[user_id][creator_id] += amount
-            else:
-                # Optionally handle the creator's own amount if necessary
-                pass
+    # Each user owes the creator their share, summed per (debtor, creditor) pair in SQL
+    edges = (
+        db.query(InvoiceShare.user_id, Data.creator_id, func.sum(InvoiceShare.amount))
+        .join(Data, Data.id == InvoiceShare.invoice_id)
+        .filter(Data.room_id == room_id, InvoiceShare.user_id != Data.creator_id)
+        .group_by(InvoiceShare.user_id, Data.creator_id)
+        .all()
+    )
+    for user_id, creator_id, amount in edges:
+        debts[user_id][creator_id] = amount
 
     # Simplify debts by netting reciprocal debts
+    # The reverse edge is popped, so every debtor/creditor pair is visited once
     simplified_debts = defaultdict(dict)
     
-    for debtor_id in participants:
-        for creditor_id in participants:
-            if debtor_id == creditor_id:
+    for debtor_id, creditors in debts.items():
+        if debtor_id not in participants:
+            continue
+        for creditor_id, amount_owed in creditors.items():
+            if creditor_id not in participants:
                 continue
-            amount_owed = debts.get(debtor_id, {}).get(creditor_id, 0)
-            reverse_amount = debts.get(creditor_id, {}).get(debtor_id, 0)
+            reverse_debts = debts.get(creditor_id)
+            reverse_amount = reverse_debts.pop(debtor_id, 0) if reverse_debts else 0
             net_amount = amount_owed - reverse_amount
             if net_amount > 0:
                 simplified_debts[debtor_id][creditor_id] = net_amount
+            elif net_amount < 0:
+                simplified_debts[creditor_id][debtor_id] = -net_amount
 
     # Remove entries with no debts
     result = {
@@ -439,26 +501,31 @@ def get_balances_in_room(room_id: int, db: Session = Depends(get_db)):
 
 @app.get("/api/users/{user_id}", response_model=UserBase)
 def get_user(user_id: int, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == user_id).first()
+    user = crud.get_user(db, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
-@app.on_event("startup")
+# Разовая миграция старых данных: "Имя: ..." -> "Имя" в data.creator_name, если такая колонка осталась в базе.
+# Запускается вручную: python main.py --migrate
 def clean_creator_names():
-    # Clean up creator names before starting the server
-    db = SessionLocal()
-    try:
-        invoices = db.query(models.Data).all()
-        for invoice in invoices:
-            if ':' in invoice.creator_name:
-                # Extract the creator's name before the colon
-                creator_name = invoice.creator_name.split(':')[0].strip()
-                invoice.creator_name = creator_name
-        db.commit()
-    finally:
-        db.close()
+    inspector = inspect(engine)
+    if 'data' not in inspector.get_table_names():
+        return
+    if 'creator_name' not in {column['name'] for column in inspector.get_columns('data')}:
+        return
+
+    with engine.begin() as conn:
+        conn.execute(text(
+            "UPDATE data SET creator_name = trim(substr(creator_name, 1, instr(creator_name, ':') - 1)) "
+            "WHERE creator_name LIKE '%:%'"
+        ))
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
+    import sys
+    if "--migrate" in sys.argv:
+        init_db()
+        clean_creator_names()
+    else:
+        import uvicorn
+        uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
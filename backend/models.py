@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Enum, ForeignKey, Float, Date, JSON, Boolean, Table
+from sqlalchemy import Column, Integer, String, Enum, ForeignKey, Float, Date, JSON, Boolean, Table, Index
 from sqlalchemy.orm import relationship
 from database import Base
 import enum
@@ -22,7 +22,10 @@ room_participants = Table(
     'room_participants',
     Base.metadata,
     Column('room_id', Integer, ForeignKey('rooms.id')),
-    Column('user_id', Integer, ForeignKey('users.id'))
+    Column('user_id', Integer, ForeignKey('users.id')),
+    # Indexes for both directions of the join
+    Index('ix_rp_room_user', 'room_id', 'user_id', unique=True),
+    Index('ix_rp_user', 'user_id')
 )
 
 class Room(Base):
@@ -31,10 +34,11 @@ class Room(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
     expense_type = Column(Enum(ExpenseType), nullable=False)
-    invoices = Column(JSON, default=[])  # Store invoice IDs as a JSON array
 
     # Participants relationship
-    participants = relationship("User", secondary=room_participants, back_populates="rooms")
+    participants = relationship("User", secondary=room_participants, back_populates="rooms", lazy="selectin")
+    # Invoices relationship (data.room_id); not eager by default, handlers load only what they need
+    invoices = relationship("Data", back_populates="room")
 
 class Data(Base):
     __tablename__ = 'data'
@@ -44,8 +48,22 @@ class Data(Base):
     date = Column(Date)
     total = Column(Float)
     user_sums = Column(JSON)
-    creator_id = Column(Integer, ForeignKey('users.id'))
+    creator_id = Column(Integer, ForeignKey('users.id'), index=True)
+    room_id = Column(Integer, ForeignKey('rooms.id'), index=True)
     status = Column(Boolean, default=False)
     
     # Creator relationship
     creator = relationship("User", back_populates="invoices_created")
+    # Room relationship
+    room = relationship("Room", back_populates="invoices")
+    # Normalized copy of user_sums
+    shares = relationship("InvoiceShare", back_populates="invoice", cascade="all, delete-orphan")
+
+class InvoiceShare(Base):
+    __tablename__ = "invoice_shares"
+
+    invoice_id = Column(Integer, ForeignKey('data.id'), primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True, index=True)
+    amount = Column(Float, nullable=False)
+
+    invoice = relationship("Data", back_populates="shares")
@@ -0,0 +1,41 @@
+from functools import wraps
+from threading import Lock
+from typing import Dict
+from cachetools import TTLCache
+
+
+# Кэш ответов GET-эндпоинтов агрегации. Ключ включает версию комнаты,
+# поэтому после записи старые значения просто перестают совпадать с ключом
+_cache = TTLCache(maxsize=1024, ttl=30)
+_lock = Lock()
+_room_versions: Dict[int, int] = {}
+# Общая версия для ответов, которые зависят от счетов из всех комнат (например, итог по пользователю)
+_global_version = 0
+
+
+# Вызывается после успешного коммита, который изменил счета или участников комнат
+def invalidate_rooms(*room_ids):
+    global _global_version
+    with _lock:
+        for room_id in room_ids:
+            if room_id is not None:
+                _room_versions[room_id] = _room_versions.get(room_id, 0) + 1
+        _global_version += 1
+
+
+def cached_response(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        params = tuple(sorted((name, value) for name, value in kwargs.items() if name != "db"))
+        room_id = kwargs.get("room_id")
+        with _lock:
+            version = _room_versions.get(room_id, 0) if room_id is not None else _global_version
+            key = (func.__name__, params, version)
+            if key in _cache:
+                return _cache[key]
+
+        result = func(*args, **kwargs)
+        with _lock:
+            _cache[key] = result
+        return result
+    return wrapper
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, validator
 from typing import Dict, List, Optional
 from datetime import date
 from models import ExpenseType
@@ -17,6 +17,7 @@ class DataCreate(BaseModel):
     total: float
     user_sums: Dict[int, float]  # Map user IDs to amounts
     creator_id: int
+    room_id: int
 
 class DataResponse(DataCreate):
     id: int
@@ -26,6 +27,8 @@ class DataResponse(DataCreate):
     total: float
     user_sums: Dict[int, float]
     creator: UserBase
+    # NULL for invoices of deleted rooms and legacy invoices not listed in any room
+    room_id: Optional[int]
     status: bool
 
     class Config:
@@ -49,6 +52,19 @@ class RoomResponse(BaseModel):
     participants: List[UserBase]
     invoices: List[int]
 
+    # Room.invoices is a relationship, the API still returns invoice IDs
+    @validator("invoices", pre=True)
+    def invoices_to_ids(cls, invoices):
+        return [getattr(invoice, "id", invoice) for invoice in invoices]
+
     class Config:
         orm_mode = True
 
+# Lean schema for list endpoints: no relationships, so nothing is lazy-loaded on serialization
+class RoomSummary(BaseModel):
+    id: int
+    name: str
+    expense_type: ExpenseType
+
+    class Config:
+        orm_mode = True
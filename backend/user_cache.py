@@ -0,0 +1,47 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Iterable, Optional, Tuple
+
+
+# Процессный LRU-кэш пользователей: хранит только (id, name), а не ORM-объекты,
+# чтобы не тащить экземпляры между сессиями
+class UserCache:
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._by_id: "OrderedDict[int, str]" = OrderedDict()
+        self._by_name: Dict[str, int] = {}
+        self._lock = Lock()
+
+    def get_by_id(self, user_id: int) -> Optional[Tuple[int, str]]:
+        with self._lock:
+            name = self._by_id.get(user_id)
+            if name is None:
+                return None
+            self._by_id.move_to_end(user_id)
+            return user_id, name
+
+    def get_by_name(self, name: str) -> Optional[Tuple[int, str]]:
+        with self._lock:
+            user_id = self._by_name.get(name)
+            if user_id is None:
+                return None
+            self._by_id.move_to_end(user_id)
+            return user_id, name
+
+    def put(self, user_id: int, name: str):
+        with self._lock:
+            old_name = self._by_id.pop(user_id, None)
+            if old_name is not None:
+                self._by_name.pop(old_name, None)
+            self._by_id[user_id] = name
+            self._by_name[name] = user_id
+            while len(self._by_id) > self.maxsize:
+                _, evicted_name = self._by_id.popitem(last=False)
+                self._by_name.pop(evicted_name, None)
+
+    def put_many(self, users: Iterable):
+        for user in users:
+            self.put(user.id, user.name)
+
+
+user_cache = UserCache()